@@ -2,16 +2,50 @@ from unittest.mock import AsyncMock, patch
 
 import pytest
 
-from tg_notification_bot import TgNotificationBot
+from tg_notification_bot import TgNotificationBot, main
+
+
+@pytest.fixture(scope="session", autouse=True)
+def mock_aiogram_bot():
+    patcher = patch("tg_notification_bot.main._PooledBot")
+    mock_bot_class = patcher.start()
+    mock_bot_class.return_value = AsyncMock()
+    yield mock_bot_class.return_value
+    patcher.stop()
 
 
 @pytest.fixture(scope="session")
-def mock_bot():
-    with patch("aiogram.Bot") as mock_bot_class:
-        mock_bot_instance = mock_bot_class.return_value
-        mock_bot_instance.send_message = AsyncMock()
-        mock_bot_instance.send_photo = AsyncMock()
-        mock_bot_instance.send_document = AsyncMock()
-
-        TgNotificationBot(token="123456:ABCDEF1234ghIkl", chat_id="-123456789")
-        yield mock_bot_instance
+def mock_bot(mock_aiogram_bot):
+    return mock_aiogram_bot
+
+
+_throttle = TgNotificationBot._throttle
+
+
+@pytest.fixture(autouse=True)
+def _disable_rate_limits(monkeypatch):
+    monkeypatch.setattr(TgNotificationBot, "_throttle", AsyncMock())
+
+
+@pytest.fixture
+def rate_limits(monkeypatch):
+    # Autouse fixtures run first, so this puts the real throttle back
+    monkeypatch.setattr(TgNotificationBot, "_throttle", _throttle)
+
+
+@pytest.fixture(autouse=True)
+def _reset_registries(monkeypatch):
+    monkeypatch.setattr(main, "_rate_limiters", {})
+    monkeypatch.setattr(main, "_circuit_breakers", {})
+    monkeypatch.setattr(main, "_bots", main.weakref.WeakValueDictionary())
+
+
+@pytest.fixture(autouse=True)
+def _reset_mocks(mock_aiogram_bot):
+    yield
+    mock_aiogram_bot.reset_mock(side_effect=True)
+
+
+@pytest.fixture
+def notification_bot():
+    return TgNotificationBot(token="123456:ABCDEF1234ghIkl", chat_id="123456789")
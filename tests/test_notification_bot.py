@@ -0,0 +1,574 @@
+import asyncio
+import io
+import logging
+import subprocess
+import sys
+from unittest.mock import AsyncMock
+
+import pytest
+from aiogram.types import InputFile, InputMediaDocument, InputMediaPhoto, MessageEntity
+from aiogram.utils.exceptions import (
+    BotBlocked,
+    ChatNotFound,
+    NetworkError,
+    RetryAfter,
+    ValidationError,
+)
+
+from tg_notification_bot import TgNotificationBot, main
+
+
+async def test_normalized_chat_id_is_cached(notification_bot):
+    notification_bot.bot.get_chat.side_effect = [
+        ChatNotFound("chat not found"),
+        None,
+        ChatNotFound("chat not found"),
+    ]
+
+    await notification_bot.send_message("first")
+    await notification_bot.send_message("second")
+
+    assert notification_bot.bot.get_chat.await_count == 3
+    for call in notification_bot.bot.send_message.await_args_list:
+        assert call.kwargs["chat_id"] == "-123456789"
+
+
+async def test_prefixed_chat_id_skips_get_chat(notification_bot):
+    notification_bot.chat_id = "-100123456789"
+
+    await notification_bot.send_message("message")
+
+    notification_bot.bot.get_chat.assert_not_awaited()
+    notification_bot.bot.send_message.assert_awaited_once_with(
+        chat_id="-100123456789", text="message"
+    )
+
+
+async def test_chat_id_candidates_are_probed_concurrently(notification_bot):
+    started = []
+    all_started = asyncio.Event()
+
+    async def get_chat(chat_id):
+        # Each probe waits for the others, so sequential probing would never finish
+        started.append(chat_id)
+        if len(started) == 3:
+            all_started.set()
+        await all_started.wait()
+        if chat_id != "-100123456789":
+            raise ChatNotFound("chat not found")
+
+    notification_bot.bot.get_chat.side_effect = get_chat
+
+    chat_id = await asyncio.wait_for(
+        notification_bot._normalize_chat_id("123456789"), timeout=1
+    )
+
+    assert chat_id == "-100123456789"
+    assert sorted(started) == ["-100123456789", "-123456789", "123456789"]
+
+
+async def test_chat_id_probing_raises_when_chat_not_found(notification_bot):
+    notification_bot.bot.get_chat.side_effect = ChatNotFound("chat not found")
+
+    with pytest.raises(ChatNotFound):
+        await notification_bot._normalize_chat_id("123456789")
+
+
+@pytest.mark.parametrize(
+    "method,args",
+    [
+        ("send_message", ("message",)),
+        ("send_photo", (b"photo",)),
+        ("send_document", (b"document",)),
+    ],
+)
+async def test_send_errors_are_logged(notification_bot, caplog, method, args):
+    notification_bot.chat_id = "-123456789"
+    getattr(notification_bot.bot, method).side_effect = BotBlocked("bot was blocked")
+
+    with caplog.at_level(logging.WARNING):
+        await getattr(notification_bot, method)(*args)
+
+    assert "Бот заблокирован" in caplog.text
+
+
+async def test_send_document_streams_local_path(notification_bot, tmp_path):
+    notification_bot.chat_id = "-123456789"
+    document_path = tmp_path / "report.pdf"
+    document_path.write_bytes(b"test_document_bytes")
+
+    await notification_bot.send_document(str(document_path), caption="Report")
+
+    document = notification_bot.bot.send_document.await_args.kwargs["document"]
+    assert isinstance(document, InputFile)
+    assert document.filename == "report.pdf"
+
+
+async def test_local_path_is_checked_on_every_send(notification_bot, tmp_path):
+    notification_bot.chat_id = "-123456789"
+    document_path = tmp_path / "report.pdf"
+
+    await notification_bot.send_document(str(document_path))
+    document_path.write_bytes(b"test_document_bytes")
+    await notification_bot.send_document(str(document_path))
+
+    first, second = notification_bot.bot.send_document.await_args_list
+    assert first.kwargs["document"] == str(document_path)
+    assert isinstance(second.kwargs["document"], InputFile)
+
+
+async def test_unreadable_local_path_is_logged(
+    notification_bot, tmp_path, monkeypatch, caplog
+):
+    notification_bot.chat_id = "-123456789"
+    # The file disappears between the existence check and the open
+    monkeypatch.setattr(main, "_is_local_file", lambda path: True)
+
+    with caplog.at_level(logging.ERROR):
+        await notification_bot.send_document(str(tmp_path / "report.pdf"))
+
+    assert "Ошибка при отправке документа" in caplog.text
+    notification_bot.bot.send_document.assert_not_awaited()
+
+
+def test_package_import_is_lazy():
+    code = (
+        "import sys, tg_notification_bot; "
+        "assert 'aiogram' not in sys.modules; "
+        "tg_notification_bot.TgNotificationBot; "
+        "assert 'aiogram' in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+async def test_send_photo_passes_url_through(notification_bot):
+    notification_bot.chat_id = "-123456789"
+    photo_url = "https://example.com/photo.jpg"
+
+    await notification_bot.send_photo(photo_url)
+
+    notification_bot.bot.send_photo.assert_awaited_once_with(
+        chat_id="-123456789", photo=photo_url, caption=None
+    )
+
+
+@pytest.mark.parametrize("message", ["", "a" * 4097])
+async def test_invalid_message_length_is_rejected_locally(notification_bot, message):
+    await notification_bot.send_message(message)
+
+    notification_bot.bot.get_chat.assert_not_awaited()
+    notification_bot.bot.send_message.assert_not_awaited()
+
+
+async def test_too_long_caption_is_rejected_locally(notification_bot):
+    await notification_bot.send_photo(b"photo", caption="a" * 1025)
+
+    notification_bot.bot.send_photo.assert_not_awaited()
+
+
+async def test_send_defaults_are_passed_to_every_send():
+    notification_bot = TgNotificationBot(
+        token="123456:ABCDEF1234ghIkl",
+        chat_id="-123456789",
+        parse_mode="HTML",
+        disable_notification=True,
+    )
+
+    await notification_bot.send_message("<b>message</b>")
+    await notification_bot.send_photo(b"photo")
+
+    notification_bot.bot.send_message.assert_awaited_once_with(
+        chat_id="-123456789",
+        text="<b>message</b>",
+        parse_mode="HTML",
+        disable_notification=True,
+    )
+    notification_bot.bot.send_photo.assert_awaited_once_with(
+        chat_id="-123456789",
+        photo=b"photo",
+        caption=None,
+        parse_mode="HTML",
+        disable_notification=True,
+    )
+
+
+async def test_shared_connector_is_reused_within_loop():
+    connector = main._get_shared_connector()
+
+    assert main._get_shared_connector() is connector
+    await connector.close()
+    assert main._get_shared_connector() is not connector
+    await main._get_shared_connector().close()
+
+
+async def test_send_messages_resolves_chat_id_once(notification_bot):
+    notification_bot.bot.get_chat.side_effect = [
+        ChatNotFound("chat not found"),
+        None,
+        ChatNotFound("chat not found"),
+    ]
+
+    await notification_bot.send_messages(["first", "second", "third"], concurrency=2)
+
+    assert notification_bot.bot.get_chat.await_count == 3
+    assert [
+        call.kwargs["text"]
+        for call in notification_bot.bot.send_message.await_args_list
+    ] == ["first", "second", "third"]
+
+
+async def test_send_messages_reports_chat_id_timeout_per_send(
+    notification_bot, mock_sleep, caplog
+):
+    notification_bot.max_retry_attempts = 1
+    notification_bot.bot.get_chat.side_effect = asyncio.TimeoutError()
+
+    with caplog.at_level(logging.ERROR):
+        await notification_bot.send_messages(["first", "second"])
+
+    assert caplog.text.count("Ошибка при отправке сообщения") == 2
+    notification_bot.bot.send_message.assert_not_awaited()
+
+
+@pytest.mark.parametrize("concurrency", [0, -1])
+async def test_send_messages_rejects_invalid_concurrency(notification_bot, concurrency):
+    with pytest.raises(ValueError):
+        await notification_bot.send_messages(["message"], concurrency=concurrency)
+
+    notification_bot.bot.send_message.assert_not_awaited()
+
+
+def test_aiogram_bot_is_created_on_first_use(notification_bot):
+    assert notification_bot._bot is None
+    assert notification_bot.bot is notification_bot.bot
+
+
+async def test_close_does_not_open_a_new_session(notification_bot):
+    await notification_bot.close()
+    notification_bot.bot
+
+    await notification_bot.close()
+
+    notification_bot.bot.close.assert_awaited_once()
+    notification_bot.bot.get_session.assert_not_awaited()
+
+
+@pytest.mark.parametrize(
+    "token",
+    ["invalid token", "123:abc", "123456:ABCDEF:1234ghIkl", "123456:" + "a" * 100],
+)
+def test_invalid_token_is_rejected_on_construction(token):
+    with pytest.raises(ValidationError):
+        TgNotificationBot(token=token, chat_id="-123456789")
+
+
+async def test_concurrent_sends_resolve_chat_id_once(notification_bot):
+    notification_bot.bot.get_chat.side_effect = [
+        ChatNotFound("chat not found"),
+        None,
+        ChatNotFound("chat not found"),
+    ]
+
+    await asyncio.gather(
+        notification_bot.send_message("first"),
+        notification_bot.send_message("second"),
+    )
+
+    assert notification_bot.bot.get_chat.await_count == 3
+    assert notification_bot.bot.send_message.await_count == 2
+
+
+def test_connector_is_passed_to_aiogram_bot(mock_aiogram_bot):
+    connector = object()
+    notification_bot = TgNotificationBot(
+        token="123456:ABCDEF1234ghIkl", chat_id="-123456789", connector=connector
+    )
+
+    notification_bot.bot
+
+    assert main._PooledBot.call_args.kwargs["connector"] is connector
+
+
+async def test_unresolvable_chat_id_is_logged(notification_bot, caplog):
+    notification_bot.bot.get_chat.side_effect = ChatNotFound("chat not found")
+
+    with caplog.at_level(logging.WARNING):
+        await notification_bot.send_message("message")
+
+    assert "не найден" in caplog.text
+    notification_bot.bot.send_message.assert_not_awaited()
+
+
+@pytest.fixture
+def mock_sleep(monkeypatch):
+    sleep = AsyncMock()
+    monkeypatch.setattr(main.asyncio, "sleep", sleep)
+    return sleep
+
+
+async def test_send_is_retried_after_flood_control(notification_bot, mock_sleep):
+    notification_bot.chat_id = "-123456789"
+    notification_bot.bot.send_message.side_effect = [RetryAfter(5), None]
+
+    await notification_bot.send_message("message")
+
+    assert notification_bot.bot.send_message.await_count == 2
+    assert 5 <= mock_sleep.await_args.args[0] <= 5 + main.RETRY_JITTER
+
+
+async def test_retried_local_upload_is_reopened(notification_bot, tmp_path, mock_sleep):
+    notification_bot.chat_id = "-123456789"
+    document_path = tmp_path / "report.pdf"
+    document_path.write_bytes(b"test_document_bytes")
+    uploads = []
+
+    async def send_document(document, **kwargs):
+        # aiohttp closes the file once the request body is written
+        uploads.append(document.file.read())
+        document.file.close()
+        if len(uploads) == 1:
+            raise NetworkError("aiohttp client throws an error")
+
+    notification_bot.bot.send_document.side_effect = send_document
+
+    await notification_bot.send_document(str(document_path))
+
+    assert uploads == [b"test_document_bytes", b"test_document_bytes"]
+
+
+async def test_caller_stream_upload_is_not_retried(notification_bot, mock_sleep):
+    notification_bot.chat_id = "-123456789"
+    notification_bot.bot.send_document.side_effect = NetworkError(
+        "aiohttp client throws an error"
+    )
+
+    await notification_bot.send_document(io.BytesIO(b"test_document_bytes"))
+
+    notification_bot.bot.send_document.assert_awaited_once()
+    mock_sleep.assert_not_awaited()
+
+
+async def test_long_flood_control_is_not_retried(notification_bot, mock_sleep):
+    notification_bot.chat_id = "-123456789"
+    notification_bot.bot.send_message.side_effect = RetryAfter(3600)
+
+    await notification_bot.send_message("message")
+
+    notification_bot.bot.send_message.assert_awaited_once()
+    mock_sleep.assert_not_awaited()
+
+
+async def test_too_large_upload_is_not_retried(notification_bot, mock_sleep, caplog):
+    notification_bot.chat_id = "-123456789"
+    notification_bot.bot.send_document.side_effect = NetworkError(
+        "File too large for uploading. Check telegram api limits"
+    )
+
+    with caplog.at_level(logging.ERROR):
+        await notification_bot.send_document(b"document")
+
+    notification_bot.bot.send_document.assert_awaited_once()
+    mock_sleep.assert_not_awaited()
+    assert "File too large" in caplog.text
+
+
+async def test_token_bucket_delays_when_empty(mock_sleep):
+    bucket = main._TokenBucket(rate=1, burst=2)
+
+    await bucket.acquire()
+    await bucket.acquire()
+    mock_sleep.assert_not_awaited()
+
+    await bucket.acquire()
+    assert mock_sleep.await_args.args[0] == pytest.approx(1, abs=0.05)
+
+
+async def test_second_send_to_same_chat_waits_for_chat_bucket(
+    notification_bot, rate_limits, mock_sleep
+):
+    notification_bot.chat_id = "-123456789"
+
+    await notification_bot.send_message("first")
+    mock_sleep.assert_not_awaited()
+
+    await notification_bot.send_message("second")
+    mock_sleep.assert_awaited_once()
+    assert mock_sleep.await_args.args[0] == pytest.approx(
+        1 / main.CHAT_RATE_LIMIT, abs=0.05
+    )
+    assert set(main._rate_limiters) == {
+        ("123456:ABCDEF1234ghIkl",),
+        ("123456:ABCDEF1234ghIkl", "-123456789"),
+    }
+
+
+async def test_circuit_opens_after_repeated_network_errors(
+    notification_bot, mock_sleep
+):
+    notification_bot.chat_id = "-123456789"
+    notification_bot.max_retry_attempts = 1
+    notification_bot.bot.send_message.side_effect = NetworkError("timeout")
+
+    for _ in range(main.CIRCUIT_FAILURE_THRESHOLD + 2):
+        await notification_bot.send_message("message")
+
+    assert (
+        notification_bot.bot.send_message.await_count == main.CIRCUIT_FAILURE_THRESHOLD
+    )
+
+
+async def test_too_large_uploads_do_not_open_circuit(notification_bot, mock_sleep):
+    notification_bot.chat_id = "-123456789"
+    notification_bot.bot.send_document.side_effect = NetworkError(
+        "File too large for uploading. Check telegram api limits"
+    )
+
+    for _ in range(main.CIRCUIT_FAILURE_THRESHOLD):
+        await notification_bot.send_document(b"document")
+    await notification_bot.send_message("message")
+
+    notification_bot.bot.send_message.assert_awaited_once()
+
+
+def test_circuit_lets_one_trial_through_after_reset_timeout():
+    breaker = main._CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record(failed=True)
+    assert not breaker.allow()
+
+    breaker._opened_at -= 30
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record(failed=False)
+    assert breaker.allow()
+
+
+async def test_send_media_group_is_split_into_albums_of_ten(notification_bot):
+    notification_bot.chat_id = "-123456789"
+    photos = [InputMediaPhoto(f"photo_{i}") for i in range(12)]
+
+    await notification_bot.send_media_group(photos)
+
+    assert [
+        len(call.kwargs["media"])
+        for call in notification_bot.bot.send_media_group.await_args_list
+    ] == [10, 2]
+
+
+async def test_send_media_group_leaves_no_single_item_album(notification_bot):
+    notification_bot.chat_id = "-123456789"
+    photos = [InputMediaPhoto(f"photo_{i}") for i in range(11)]
+
+    await notification_bot.send_media_group(photos)
+
+    assert [
+        len(call.kwargs["media"])
+        for call in notification_bot.bot.send_media_group.await_args_list
+    ] == [9, 2]
+
+
+async def test_single_item_media_group_is_sent_as_document(notification_bot):
+    notification_bot.chat_id = "-123456789"
+
+    entities = [MessageEntity(type="bold", offset=0, length=6)]
+
+    await notification_bot.send_media_group(
+        [
+            InputMediaDocument(
+                "document_id",
+                thumb="thumb_id",
+                caption="Report",
+                caption_entities=entities,
+                disable_content_type_detection=True,
+            )
+        ]
+    )
+
+    notification_bot.bot.send_media_group.assert_not_awaited()
+    notification_bot.bot.send_document.assert_awaited_once_with(
+        chat_id="-123456789",
+        document="document_id",
+        thumb="thumb_id",
+        caption="Report",
+        parse_mode=None,
+        caption_entities=entities,
+        disable_content_type_detection=True,
+    )
+
+
+async def test_single_item_media_group_keeps_photo_spoiler(notification_bot):
+    notification_bot.chat_id = "-123456789"
+
+    await notification_bot.send_media_group(
+        [InputMediaPhoto("photo_id", has_spoiler=True)]
+    )
+
+    assert notification_bot.bot.send_photo.await_args.kwargs["has_spoiler"] is True
+
+
+async def test_too_long_album_caption_is_rejected_locally(notification_bot):
+    notification_bot.chat_id = "-123456789"
+    photos = [
+        InputMediaPhoto("photo_1"),
+        InputMediaPhoto("photo_2", caption="a" * 1025),
+    ]
+
+    await notification_bot.send_media_group(photos)
+
+    notification_bot.bot.send_media_group.assert_not_awaited()
+
+
+async def test_send_photo_accepts_pathlike_and_bytes(notification_bot, tmp_path):
+    notification_bot.chat_id = "-123456789"
+    photo_path = tmp_path / "photo.jpg"
+    photo_path.write_bytes(b"test_photo_bytes")
+
+    await notification_bot.send_photo(photo_path)
+    await notification_bot.send_photo(b"test_photo_bytes")
+
+    first, second = notification_bot.bot.send_photo.await_args_list
+    assert isinstance(first.kwargs["photo"], InputFile)
+    assert first.kwargs["photo"].filename == "photo.jpg"
+    assert second.kwargs["photo"] == b"test_photo_bytes"
+
+
+async def test_username_chat_id_skips_get_chat():
+    notification_bot = TgNotificationBot(
+        token="123456:ABCDEF1234ghIkl", chat_id="@channel"
+    )
+
+    await notification_bot.send_message("message")
+
+    notification_bot.bot.get_chat.assert_not_awaited()
+    notification_bot.bot.send_message.assert_awaited_once_with(
+        chat_id="@channel", text="message"
+    )
+
+
+@pytest.mark.parametrize("chat_id", ["", "chat", "--123", "-abc"])
+def test_invalid_chat_id_is_rejected_on_construction(chat_id):
+    with pytest.raises(ValueError):
+        TgNotificationBot(token="123456:ABCDEF1234ghIkl", chat_id=chat_id)
+
+
+def test_notifiers_with_same_token_share_aiogram_bot():
+    calls = main._PooledBot.call_count
+    first = TgNotificationBot(token="123456:ABCDEF1234ghIkl", chat_id="-1")
+    second = TgNotificationBot(token="123456:ABCDEF1234ghIkl", chat_id="-2")
+
+    assert first.bot is second.bot
+    assert main._PooledBot.call_count == calls + 1
+
+
+async def test_integer_chat_id_is_sent_as_is():
+    notification_bot = TgNotificationBot(
+        token="123456:ABCDEF1234ghIkl", chat_id=123456789
+    )
+
+    await notification_bot.send_message("message")
+
+    assert notification_bot.chat_id == "123456789"
+    notification_bot.bot.get_chat.assert_not_awaited()
+    notification_bot.bot.send_message.assert_awaited_once_with(
+        chat_id="123456789", text="message"
+    )
@@ -1 +1,15 @@
-from .main import *
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .main import TgNotificationBot
+
+__all__ = ["TgNotificationBot"]
+
+
+def __getattr__(name):
+    if name == "TgNotificationBot":
+        from .main import TgNotificationBot
+
+        globals()[name] = TgNotificationBot
+        return TgNotificationBot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
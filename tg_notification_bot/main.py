@@ -1,93 +1,544 @@
+import asyncio
+import atexit
+import contextlib
+import io
 import logging
-from typing import Union
+import os
+import random
+import ssl
+import threading
+import time
+import warnings
+import weakref
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from aiogram import Bot, exceptions
-from aiogram.utils.exceptions import ChatNotFound, TelegramAPIError
+import aiohttp
+import certifi
+from aiogram import Bot, types
+from aiogram.bot.api import check_token
+from aiogram.utils import json
+from aiogram.utils.exceptions import (
+    BotBlocked,
+    ChatNotFound,
+    NetworkError,
+    RestartingTelegram,
+    RetryAfter,
+    TelegramAPIError,
+    ValidationError,
+)
 
+MAX_MESSAGE_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+MAX_MEDIA_GROUP_SIZE = 10
+MAX_RETRY_ATTEMPTS = 8
+RETRY_BACKOFF_BASE = 1.0
+RETRY_JITTER = 0.5
+GLOBAL_RATE_LIMIT = 30
+CHAT_RATE_LIMIT = 1
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
 
-class TgNotificationBot:
-    def __init__(self, token: str, chat_id: Union[int, str]):
-        self.bot = Bot(token=token)
-        self.chat_id = chat_id
-        self.logger = logging.getLogger(__name__)
+_LOG = logging.getLogger(__name__)
 
-    async def send_message(self, message: str):
-        chat_id = await self._normalize_chat_id(self.chat_id)
-        try:
-            await self.bot.send_message(chat_id=chat_id, text=message)
-        except exceptions.BotBlocked:
-            self.logger.warning(
-                f"Бот заблокирован пользователем или не имеет доступа к чату с ID {self.chat_id}"
+_TRANSIENT_ERRORS = (NetworkError, RestartingTelegram, asyncio.TimeoutError)
+
+# aiogram reports HTTP 413 as a NetworkError too, but uploading the same file again cannot help
+_FILE_TOO_LARGE_PREFIX = "File too large"
+
+FileInput = Union[str, os.PathLike, bytes, io.IOBase, types.InputFile]
+
+_shared_connector: Optional[aiohttp.TCPConnector] = None
+_rate_limiters: Dict[Tuple[str, ...], "_TokenBucket"] = {}
+_circuit_breakers: Dict[str, "_CircuitBreaker"] = {}
+_bots: "weakref.WeakValueDictionary[Tuple[str, Optional[int]], Bot]" = (
+    weakref.WeakValueDictionary()
+)
+_bots_lock = threading.Lock()
+
+
+def _get_shared_connector() -> aiohttp.TCPConnector:
+    global _shared_connector
+    loop = asyncio.get_running_loop()
+    if (
+        _shared_connector is None
+        or _shared_connector.closed
+        or _shared_connector._loop is not loop
+    ):
+        _shared_connector = aiohttp.TCPConnector(
+            limit=100,
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+        )
+    return _shared_connector
+
+
+@atexit.register
+def _close_shared_connector() -> None:
+    if _shared_connector is not None and not _shared_connector.closed:
+        # The event loop is usually gone at exit, so close the transports synchronously
+        _shared_connector._close()
+
+
+class _PooledBot(Bot):
+    def __init__(
+        self, *args, connector: Optional[aiohttp.BaseConnector] = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self._pool_connector = connector
+
+    async def get_new_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=self._pool_connector or _get_shared_connector(),
+            connector_owner=False,
+            json_serialize=json.dumps,
+        )
+
+
+def _check_token(token: str):
+    # Cheap structural checks first: aiogram's check_token walks every character
+    if isinstance(token, str):
+        if not 10 <= len(token) <= 100:
+            raise ValidationError("Token is invalid! Wrong length.")
+        sep = token.find(":")
+        if sep > 0 and token.find(":", sep + 1) != -1:
+            raise ValidationError("Token is invalid!")
+    check_token(token)
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # The token is reserved even when the bucket is empty, the deficit is the wait
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+def _is_transient(error: BaseException) -> bool:
+    return isinstance(error, _TRANSIENT_ERRORS) and not str(error).startswith(
+        _FILE_TOO_LARGE_PREFIX
+    )
+
+
+def _get_rate_limiter(key: Tuple[str, ...], rate: float, burst: int) -> _TokenBucket:
+    bucket = _rate_limiters.get(key)
+    if bucket is None:
+        bucket = _rate_limiters[key] = _TokenBucket(rate, burst)
+    return bucket
+
+
+class _CircuitOpenError(Exception):
+    pass
+
+
+class _CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+            return False
+        # Half-open: let a single trial request through
+        self._probing = True
+        return True
+
+    def record(self, failed: bool):
+        if not failed:
+            if self._opened_at is not None:
+                _LOG.info("Связь с Telegram API восстановлена")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            return
+        self._failures += 1
+        if self._probing or (
+            self._opened_at is None and self._failures >= self.failure_threshold
+        ):
+            _LOG.error(
+                "Telegram API недоступен, отправка приостановлена на %s секунд",
+                self.reset_timeout,
             )
-        except exceptions.ChatNotFound:
-            self.logger.warning(f"Чат с ID {self.chat_id} не найден")
-        except exceptions.RetryAfter as e:
-            self.logger.warning(
-                f"Превышено ограничение на отправку сообщений. Повторите через {e.timeout} секунд"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+def _get_circuit_breaker(token: str) -> _CircuitBreaker:
+    breaker = _circuit_breakers.get(token)
+    if breaker is None:
+        breaker = _circuit_breakers[token] = _CircuitBreaker(
+            CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+        )
+    return breaker
+
+
+def _get_bot(token: str, connector: Optional[aiohttp.BaseConnector]) -> Bot:
+    # The connector is part of the key: a bot built on a caller's connector is not shared
+    key = (token, id(connector) if connector is not None else None)
+    with _bots_lock:
+        bot = _bots.get(key)
+        if bot is None:
+            bot = _bots[key] = _PooledBot(
+                token=token, validate_token=False, connector=connector
             )
-        except Exception as e:
-            self.logger.error(
-                f"Ошибка при отправке сообщения в чат {self.chat_id}: {e}"
+    return bot
+
+
+def _is_local_file(path: str) -> bool:
+    return os.path.isfile(path)
+
+
+def _prepare_file_input(file_input: FileInput) -> FileInput:
+    if isinstance(file_input, os.PathLike):
+        file_input = os.fspath(file_input)
+    if not isinstance(file_input, str) or file_input.startswith(
+        ("http://", "https://")
+    ):
+        return file_input
+    if _is_local_file(file_input):
+        return types.InputFile(file_input)
+    return file_input
+
+
+def _split_media_group(items: List[types.InputMedia]) -> List[List[types.InputMedia]]:
+    chunks = []
+    for start in range(0, len(items), MAX_MEDIA_GROUP_SIZE):
+        end = start + MAX_MEDIA_GROUP_SIZE
+        chunks.append(items[start:end])
+    # sendMediaGroup takes 2-10 items, so a lone last item borrows one from the album before it
+    if len(chunks) > 1 and len(chunks[-1]) == 1:
+        chunks[-1].insert(0, chunks[-2].pop())
+    return chunks
+
+
+def _is_stream(file_input) -> bool:
+    file = file_input
+    if isinstance(file, types.InputMedia):
+        file = file.file
+    return isinstance(file, (io.IOBase, types.InputFile))
+
+
+class TgNotificationBot:
+    def __init__(
+        self,
+        token: str,
+        chat_id: Union[int, str],
+        parse_mode: Optional[str] = None,
+        disable_notification: Optional[bool] = None,
+        protect_content: Optional[bool] = None,
+        connector: Optional[aiohttp.BaseConnector] = None,
+        max_retry_attempts: int = 3,
+        max_retry_delay: float = 60,
+    ):
+        if not 1 <= max_retry_attempts <= MAX_RETRY_ATTEMPTS:
+            raise ValueError(
+                f"max_retry_attempts должен быть от 1 до {MAX_RETRY_ATTEMPTS}"
             )
+        _check_token(token)
+        # Integer ids are always exact, only bare numeric strings are ambiguous
+        exact_chat_id = type(chat_id) is int
+        chat_id = str(chat_id)
+        digits = chat_id[1:] if chat_id.startswith("-") else chat_id
+        if not (digits.isdigit() or chat_id.startswith("@")):
+            raise ValueError(f"Некорректный chat_id: {chat_id!r}")
+        self._token = token
+        self._connector = connector
+        self._bot: Optional[Bot] = None
+        self.chat_id: str = chat_id
+        self._chat_id_cache: Dict[str, str] = {}
+        self._resolve_lock: Optional[asyncio.Lock] = None
+        if exact_chat_id or chat_id.startswith(("-", "@")):
+            # Unambiguous formats are canonical already, only bare numbers need probing
+            self._chat_id_cache[chat_id] = chat_id
+        self.max_retry_attempts = max_retry_attempts
+        self.max_retry_delay = max_retry_delay
+        self._send_defaults: Dict[str, Any] = {
+            key: value
+            for key, value in (
+                ("parse_mode", parse_mode),
+                ("disable_notification", disable_notification),
+                ("protect_content", protect_content),
+            )
+            if value is not None
+        }
 
-    async def send_photo(self, photo, caption=None):
-        chat_id = await self._normalize_chat_id(self.chat_id)
-        try:
-            await self.bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
-        except exceptions.BotBlocked:
-            self.logger.warning(
-                f"Бот заблокирован пользователем или не имеет доступа к чату с ID {self.chat_id}"
+    @property
+    def bot(self) -> Bot:
+        # Created on first use: aiogram's Bot loads the CA bundle in __init__
+        if self._bot is None:
+            self._bot = _get_bot(self._token, self._connector)
+        return self._bot
+
+    async def close(self):
+        if self._bot is None:
+            return
+        # BaseBot.close only closes a session that exists. Its deprecation warning bypasses
+        # filters, so it is recorded away; it is raised by the call, not by the await
+        with warnings.catch_warnings(record=True):
+            closing = self._bot.close()
+        await closing
+
+    async def send_message(self, message: str):
+        # With parse_mode set the length is only known after Telegram strips the markup
+        if not message or (
+            "parse_mode" not in self._send_defaults
+            and len(message) > MAX_MESSAGE_LENGTH
+        ):
+            _LOG.error(
+                "Длина сообщения для чата %s должна быть от 1 до %s символов",
+                self.chat_id,
+                MAX_MESSAGE_LENGTH,
+            )
+            return
+        await self._safe_send(
+            lambda chat_id: self.bot.send_message(
+                chat_id=chat_id, text=message, **self._send_defaults
+            ),
+            "сообщения",
+        )
+
+    async def send_messages(self, messages: Iterable[str], concurrency: int = 25):
+        if concurrency < 1:
+            raise ValueError("concurrency должен быть не меньше 1")
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(message: str):
+            async with semaphore:
+                await self.send_message(message)
+
+        # Resolve the chat id once so concurrent sends hit the cache instead of probing;
+        # a failure here is reported by each send
+        with contextlib.suppress(Exception):
+            await self._normalize_chat_id(self.chat_id)
+        await asyncio.gather(*(send(message) for message in messages))
+
+    async def send_photo(self, photo: FileInput, caption: Optional[str] = None):
+        if not self._check_caption(caption):
+            return
+        await self._safe_send(
+            lambda chat_id, photo: self.bot.send_photo(
+                chat_id=chat_id, photo=photo, caption=caption, **self._send_defaults
+            ),
+            "фото",
+            photo,
+        )
+
+    async def send_document(self, document: FileInput, caption: Optional[str] = None):
+        if not self._check_caption(caption):
+            return
+        await self._safe_send(
+            lambda chat_id, document: self.bot.send_document(
+                chat_id=chat_id,
+                document=document,
+                caption=caption,
+                **self._send_defaults,
+            ),
+            "документа",
+            document,
+        )
+
+    async def send_media_group(
+        self, media: Iterable[Union[types.InputMediaPhoto, types.InputMediaDocument]]
+    ):
+        items = list(media)
+        if not all(self._check_caption(item.caption) for item in items):
+            return
+        defaults = {
+            key: value
+            for key, value in self._send_defaults.items()
+            if key != "parse_mode"
+        }
+        # sendMediaGroup has no parse_mode of its own, it is set per item
+        parse_mode = self._send_defaults.get("parse_mode")
+        if parse_mode is not None:
+            for item in items:
+                if item.parse_mode is None:
+                    item.parse_mode = parse_mode
+        if len(items) == 1:
+            await self._send_single_media(items[0], defaults)
+            return
+        for chunk in _split_media_group(items):
+            await self._safe_send(
+                lambda chat_id, *chunk: self.bot.send_media_group(
+                    chat_id=chat_id, media=list(chunk), **defaults
+                ),
+                "альбома",
+                *chunk,
             )
-        except exceptions.ChatNotFound:
-            self.logger.warning(f"Чат с ID {self.chat_id} не найден")
-        except exceptions.RetryAfter as e:
-            self.logger.warning(
-                f"Превышено ограничение на отправку сообщений. Повторите через {e.timeout} секунд"
+
+    async def _send_single_media(
+        self, item: types.InputMedia, defaults: Dict[str, Any]
+    ):
+        # A one-item album is rejected by Telegram, so it goes out as a plain photo or document
+        options = {
+            "caption": item.caption,
+            "parse_mode": item.parse_mode,
+            "caption_entities": item.caption_entities,
+            **defaults,
+        }
+        if isinstance(item, types.InputMediaPhoto):
+            await self._safe_send(
+                lambda chat_id, photo: self.bot.send_photo(
+                    chat_id=chat_id,
+                    photo=photo,
+                    has_spoiler=item.has_spoiler,
+                    **options,
+                ),
+                "фото",
+                item.file or item.media,
             )
-        except Exception as e:
-            self.logger.error(f"Ошибка при отправке фото в чат {self.chat_id}: {e}")
+            return
+        await self._safe_send(
+            lambda chat_id, document, thumb: self.bot.send_document(
+                chat_id=chat_id,
+                document=document,
+                thumb=thumb,
+                disable_content_type_detection=item.values.get(
+                    "disable_content_type_detection"
+                ),
+                **options,
+            ),
+            "документа",
+            item.file or item.media,
+            item.thumb_file or item.thumb,
+        )
 
-    async def send_document(self, document, caption=None):
-        chat_id = await self._normalize_chat_id(self.chat_id)
+    async def _safe_send(
+        self, send: Callable[..., Awaitable[Any]], kind: str, *file_inputs
+    ):
         try:
-            await self.bot.send_document(
-                chat_id=chat_id, document=document, caption=caption
+            return await self._send_with_retry(send, file_inputs)
+        except BotBlocked:
+            _LOG.warning(
+                "Бот заблокирован пользователем или не имеет доступа к чату с ID %s",
+                self.chat_id,
             )
-        except exceptions.BotBlocked:
-            self.logger.warning(
-                f"Бот заблокирован пользователем или не имеет доступа к чату с ID {self.chat_id}"
+        except ChatNotFound:
+            _LOG.warning("Чат с ID %s не найден", self.chat_id)
+        except _CircuitOpenError:
+            _LOG.warning(
+                "Отправка %s в чат %s пропущена: Telegram API недоступен",
+                kind,
+                self.chat_id,
             )
-        except exceptions.ChatNotFound:
-            self.logger.warning(f"Чат с ID {self.chat_id} не найден")
-        except exceptions.RetryAfter as e:
-            self.logger.warning(
-                f"Превышено ограничение на отправку сообщений. Повторите через {e.timeout} секунд"
+        except RetryAfter as e:
+            _LOG.warning(
+                "Превышено ограничение на отправку сообщений. Повторите через %s секунд",
+                e.timeout,
             )
         except Exception as e:
-            self.logger.error(
-                f"Ошибка при отправке документа в чат {self.chat_id}: {e}"
+            _LOG.error("Ошибка при отправке %s в чат %s: %s", kind, self.chat_id, e)
+
+    async def _send_with_retry(
+        self, send: Callable[..., Awaitable[Any]], file_inputs: Tuple[Any, ...]
+    ):
+        # aiohttp closes an uploaded stream after the request, so a caller's stream is
+        # sent once; local paths are reopened on every attempt instead
+        max_attempts = (
+            1 if any(map(_is_stream, file_inputs)) else self.max_retry_attempts
+        )
+        breaker = _get_circuit_breaker(self._token)
+        for attempt in range(1, max_attempts + 1):
+            if not breaker.allow():
+                raise _CircuitOpenError()
+            failed = False
+            try:
+                chat_id = await self._normalize_chat_id(self.chat_id)
+                await self._throttle(chat_id)
+                return await send(chat_id, *map(_prepare_file_input, file_inputs))
+            except RetryAfter as e:
+                if attempt == max_attempts or e.timeout > self.max_retry_delay:
+                    raise
+                delay = e.timeout
+            except _TRANSIENT_ERRORS as e:
+                # A rejected upload is a client-side error, not an outage
+                failed = _is_transient(e)
+                if attempt == max_attempts or not failed:
+                    raise
+                delay = min(
+                    self.max_retry_delay, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)
+                )
+            finally:
+                # Anything but a network-level failure means Telegram is answering
+                breaker.record(failed)
+            await asyncio.sleep(delay + random.uniform(0, RETRY_JITTER))
+
+    async def _throttle(self, chat_id: str):
+        # Buckets are keyed by token, so all instances of the same bot share the limits
+        await _get_rate_limiter(
+            (self._token,), GLOBAL_RATE_LIMIT, GLOBAL_RATE_LIMIT
+        ).acquire()
+        await _get_rate_limiter(
+            (self._token, chat_id), CHAT_RATE_LIMIT, CHAT_RATE_LIMIT
+        ).acquire()
+
+    def _check_caption(self, caption) -> bool:
+        if (
+            caption is not None
+            and "parse_mode" not in self._send_defaults
+            and len(caption) > MAX_CAPTION_LENGTH
+        ):
+            _LOG.error(
+                "Длина подписи для чата %s не должна превышать %s символов",
+                self.chat_id,
+                MAX_CAPTION_LENGTH,
             )
+            return False
+        return True
 
-    async def _normalize_chat_id(self, chat_id: Union[int, str]) -> str:
-        if isinstance(chat_id, int):
-            return str(chat_id)
-        if chat_id.startswith("-100") or chat_id.startswith("-"):
-            return chat_id
-        try:
-            await self.bot.get_chat(chat_id)
+    async def _normalize_chat_id(self, chat_id: str) -> str:
+        if chat_id in self._chat_id_cache:
+            return self._chat_id_cache[chat_id]
+        # "-..." ids are already prefixed and "@username" is accepted by the API as is
+        if chat_id.startswith(("-", "@")):
             return chat_id
-        except ChatNotFound:
-            try:
-                modified_chat_id = "-" + chat_id
-                await self.bot.get_chat(modified_chat_id)
-                return modified_chat_id
-            except ChatNotFound:
-                modified_chat_id = "-100" + chat_id
-                await self.bot.get_chat(modified_chat_id)
-                return modified_chat_id
-            except TelegramAPIError as e:
-                self.logger.error(f"Telegram API error: {e}")
+        if self._resolve_lock is None:
+            self._resolve_lock = asyncio.Lock()
+        async with self._resolve_lock:
+            # Another coroutine may have resolved the id while we were waiting
+            if chat_id in self._chat_id_cache:
+                return self._chat_id_cache[chat_id]
+            return await self._resolve_chat_id(chat_id)
+
+    async def _resolve_chat_id(self, chat_id: str) -> str:
+        candidates = (chat_id, "-" + chat_id, "-100" + chat_id)
+        results = await asyncio.gather(
+            *(self.bot.get_chat(candidate) for candidate in candidates),
+            return_exceptions=True,
+        )
+        for candidate, result in zip(candidates, results):
+            if not isinstance(result, BaseException):
+                self._chat_id_cache[chat_id] = candidate
+                return candidate
+        for result in results:
+            if not isinstance(result, TelegramAPIError):
+                raise result
+        for result in results:
+            if not isinstance(result, ChatNotFound):
+                _LOG.error("Telegram API error: %s", result)
                 return chat_id
-        except TelegramAPIError as e:
-            self.logger.error(f"Telegram API error: {e}")
-            return chat_id
+        raise results[-1]